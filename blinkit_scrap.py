@@ -1,84 +1,320 @@
-import requests
-from bs4 import BeautifulSoup
-import json
+import httpx
+import orjson
+from lxml import etree
 import logging
+import logging.handlers
 import asyncio
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 import re
 import time
 import random
 import os
+import sys
+import atexit
+import shutil
+import tempfile
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+import sqlite3
 
 # --- Configuration ---
 LOG_FILE = "scraper_log.log"
-CATEGORIZED_PIDS_FILE = "blinkit_categorized_pids.json"
-FULL_PRODUCT_DATA_FILE = "blinkit_all_product_data.json"
+LOG_BUFFER_RECORDS = 1000 # File log records held in memory between writes; WARNING and above flush at once
+CATEGORIZED_PIDS_FILE = "blinkit_categorized_pids.jsonl" # One {"url", "name", "pids"} line per finished category
+FULL_PRODUCT_DATA_FILE = "blinkit_all_product_data.jsonl" # One variant JSON object per line
+PDP_CACHE_FILE = "blinkit_pdp_cache.sqlite"
+PDP_CACHE_TTL_SECONDS = 24 * 60 * 60 # Cached PDPs older than this are fetched again
+PDP_CACHE_COMMIT_EVERY = 100
+OUTPUT_BUFFER_BYTES = 1 << 20 # Write buffer for the JSONL outputs; many small orjson lines become few large writes
+CATEGORY_CACHE_TTL_SECONDS = 6 * 60 * 60 # Category PID lists are reused from the same cache file for this long
 LOCATION_QUERY = "Mumbai"
+CATEGORY_LINKS_TIMEOUT_MS = 5000 # Wait for category links on the rendered categories page before falling back to its HTML
+BROWSER_STATE_FILE = "blinkit_state.json" # Cookies/localStorage snapshot taken after the location is set
 MAX_PLP_SCROLL_ATTEMPTS = 70 # Max scrolls per PLP
-PLP_CONCURRENCY = 5 # !!! RE-ENABLED CONCURRENCY FOR PLP SCRAPING !!!
-PDP_CONCURRENCY = 10
+PLP_SCROLL_GROWTH_TIMEOUT_MS = 8000 # No new cards within this long after a scroll ends the category
+MAX_LISTING_API_PAGES = 200 # Max listing_widgets pages followed per category
+LISTING_API_CONCURRENCY = 4 # Listing pages requested at once per category when offsets can be precomputed
+LISTING_API_MAX_ATTEMPTS = 4 # Tries per listing page on transient failures before the category falls back to scrolling
+LISTING_API_BACKOFF_BASE = 0.5 # Seconds; doubled per attempt unless Retry-After asks for longer
+LISTING_API_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BLINKIT_BASE_URL = "https://blinkit.com"
+LISTING_API_PATH = "/v1/layout/listing_widgets"
+PRODUCT_SNIPPET_TYPE = "product_card_snippet_type_2"
+# We only read IDs and links, so images/fonts/media and analytics beacons are aborted in the browser.
+# Stylesheets are kept: the location and PLP readiness checks rely on is_visible(), which needs real layout.
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+CATEGORIES_BLOCKED_RESOURCE_TYPES = BLOCKED_RESOURCE_TYPES | {"stylesheet"} # The categories page is only read, never checked for visibility
+BLOCKED_URL_FRAGMENTS = ("googletagmanager", "google-analytics", "segment.io", "branch.io", "clarity.ms", "mixpanel", "hotjar", "connect.facebook.net")
+PLP_CONCURRENCY = 8 # !!! RE-ENABLED CONCURRENCY FOR PLP SCRAPING !!! Also the only PLP rate limit: no per-category sleep
+BLINKIT_DEBUG = os.environ.get("BLINKIT_DEBUG") == "1" # Headful browser for debugging; off for normal runs
+BLINKIT_RESUME = os.environ.get("BLINKIT_RESUME") == "1" # Keep CATEGORIZED_PIDS_FILE and skip categories already in it
+BLINKIT_CDP_URL = os.environ.get("BLINKIT_CDP") # e.g. http://localhost:9222 to reuse an already running Chromium
+# Set to keep a persistent Chromium profile (e.g. ./tmp_user_data prepared with manual_chromium.py). Unset, each
+# run gets a throwaway profile under the temp dir (point TMPDIR at a tmpfs to keep it in RAM) that is removed
+# at exit; the location still carries over between runs through BROWSER_STATE_FILE.
+BLINKIT_PROFILE_DIR = os.environ.get("BLINKIT_PROFILE_DIR")
+PDP_CONCURRENCY = 16
+PDP_MAX_CONNECTIONS = 32
+PDP_CONNECT_RETRIES = 2 # Retries on connection failures only; HTTP error statuses are not retried
+PDP_TIMEOUT_SECONDS = 30
+PDP_KEEPALIVE_SECONDS = 75 # Idle pooled connections survive pacing back-offs instead of httpx's 5s default
+PDP_DELAY_INITIAL = 0.05 # Seconds between PDP request starts across all workers; adapted at runtime by AdaptiveDelay
+PDP_DELAY_MIN = 0.02 # i.e. at most 50 PDP requests/sec
+PDP_DELAY_MAX = 10.0
+PDP_BURST = PDP_CONCURRENCY # Requests that may start back to back after an idle stretch
+THROTTLE_STATUS_CODES = {429, 503}
+PDP_MAX_ATTEMPTS = 5 # Throttled PDP requests are retried with exponential backoff up to this many tries
+PDP_BACKOFF_BASE = 1.0 # Seconds; doubled per attempt unless Retry-After asks for longer
+FAILED_PDP_IDS_FILE = "pdp_failed_ids.json"
+
+PDP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://blinkit.com/',
+    'DNT': '1',
+}
+
+# The PDP state is a JSON literal assigned inside an inline <script>, followed either by another
+# window.* assignment or by the closing tag. Located on raw bytes so no DOM is ever built for a PDP.
+PRELOADED_STATE_MARKER = b'window.grofers.PRELOADED_STATE'
+CATEGORY_CID_RE = re.compile(r'/cid/(\d+)/(\d+)$') # /cn/<slug>/cid/<l0>/<l1> listing pages
+PDP_URL_FMT = "https://blinkit.com/prn/product/prid/{}".format
+PDP_ATTRIBUTE_FIELDS = { # attribute_collection title -> variant_data key
+    'Nutrition Information': 'nutrition_info',
+    'Ingredients': 'ingredients',
+    'Key Features': 'key_features',
+}
 
 # Set up logging
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# FileHandler flushes after every record; the MemoryHandler batches records into one write per
+# LOG_BUFFER_RECORDS and is flushed by logging.shutdown() at exit. basicConfig only formats the handlers
+# it is given, and MemoryHandler passes records straight to its target, so the file handler needs its own.
+log_file_handler = logging.FileHandler(LOG_FILE, mode='w')
+log_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler(LOG_FILE, mode='w'),
+        logging.handlers.MemoryHandler(
+            LOG_BUFFER_RECORDS,
+            flushLevel=logging.WARNING,
+            target=log_file_handler,
+        ),
         logging.StreamHandler()
     ]
 )
 
+# --- Helper to share one string object per PID across categories ---
+def intern_pids(pids):
+    """Returns the PIDs as a set of interned strings, so a PID listed in many categories is stored once."""
+    return {sys.intern(pid) for pid in pids}
+
+
 # --- Helper to save PIDs incrementally ---
-def save_pids_incrementally(categorized_pids_dict):
-    """Saves the entire categorized PIDs dictionary to a JSON file."""
-    serializable_dict = {k: list(v) for k, v in categorized_pids_dict.items()}
-    with open(CATEGORIZED_PIDS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(serializable_dict, f, indent=4)
-    logging.info(f"Saved incremental categorized PIDs to {CATEGORIZED_PIDS_FILE}")
+def save_pids_incrementally(pids_file, category_url, category_name, pids):
+    """Appends one category's PIDs as a JSON line and flushes, so an interrupted run keeps every finished category."""
+    pids_file.write(orjson.dumps({'url': category_url, 'name': category_name, 'pids': list(pids)}, option=orjson.OPT_APPEND_NEWLINE))
+    pids_file.flush()
+    logging.info(f"Saved categorized PIDs for {category_name} to {CATEGORIZED_PIDS_FILE}")
+
+
+def compact_categorized_pids(categorized_pids_dict):
+    """Rewrites CATEGORIZED_PIDS_FILE with one line per category, atomically via a temp file and os.replace."""
+    temp_path = CATEGORIZED_PIDS_FILE + '.tmp'
+    with open(temp_path, 'wb', buffering=OUTPUT_BUFFER_BYTES) as f:
+        for category_url, category_info in categorized_pids_dict.items():
+            f.write(orjson.dumps(
+                {'url': category_url, 'name': category_info['name'], 'pids': list(category_info['pids'])},
+                option=orjson.OPT_APPEND_NEWLINE
+            ))
+    os.replace(temp_path, CATEGORIZED_PIDS_FILE)
+    logging.info(f"Compacted {CATEGORIZED_PIDS_FILE} to {len(categorized_pids_dict)} categories.")
+
+
+# --- Helpers for the on-disk scrape cache (product_id -> variant list, category URL -> PIDs) ---
+def open_pdp_cache(cache_path=PDP_CACHE_FILE):
+    """Opens the SQLite scrape cache, creating the tables on first use."""
+    conn = sqlite3.connect(cache_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS pdp (product_id TEXT PRIMARY KEY, json BLOB, fetched_at INT, etag TEXT, last_modified TEXT)")
+    for column in ('etag', 'last_modified'): # Caches written before conditional GETs lack these columns
+        try:
+            conn.execute(f"ALTER TABLE pdp ADD COLUMN {column} TEXT")
+        except sqlite3.OperationalError:
+            pass
+    conn.execute("CREATE TABLE IF NOT EXISTS category_pids (category_url TEXT PRIMARY KEY, json BLOB, fetched_at INT)")
+    return conn
+
+
+def load_cached_pdp(conn, product_id):
+    """Returns the cached variant list for a PID, or None if missing or older than PDP_CACHE_TTL_SECONDS."""
+    row = conn.execute(
+        "SELECT json FROM pdp WHERE product_id = ? AND fetched_at > ?",
+        (str(product_id), int(time.time()) - PDP_CACHE_TTL_SECONDS)
+    ).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def load_revalidatable_pdp(conn, product_id):
+    """Returns (etag, last_modified, variants) for a cached PID that has a validator, or None."""
+    row = conn.execute(
+        "SELECT etag, last_modified, json FROM pdp WHERE product_id = ? AND (etag IS NOT NULL OR last_modified IS NOT NULL)",
+        (str(product_id),)
+    ).fetchone()
+    return (row[0], row[1], orjson.loads(row[2])) if row else None
+
+
+def store_cached_pdp(conn, product_id, product_data, validators=(None, None)):
+    """Upserts a PID's variant list with its (etag, last_modified) validators. The caller decides when to commit."""
+    conn.execute(
+        "INSERT OR REPLACE INTO pdp (product_id, json, fetched_at, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+        (str(product_id), orjson.dumps(product_data), int(time.time()), *validators)
+    )
+
+
+def load_cached_category_pids(conn, category_url):
+    """Returns the cached PID set for a category URL, or None if missing or older than CATEGORY_CACHE_TTL_SECONDS."""
+    row = conn.execute(
+        "SELECT json FROM category_pids WHERE category_url = ? AND fetched_at > ?",
+        (category_url, int(time.time()) - CATEGORY_CACHE_TTL_SECONDS)
+    ).fetchone()
+    return set(orjson.loads(row[0])) if row else None
+
+
+def store_cached_category_pids(conn, category_url, pids):
+    """Upserts and commits a category's PIDs; categories finish seconds apart, so each is committed at once."""
+    conn.execute(
+        "INSERT OR REPLACE INTO category_pids (category_url, json, fetched_at) VALUES (?, ?, ?)",
+        (category_url, orjson.dumps(list(pids)), int(time.time()))
+    )
+    conn.commit()
+
+
+# --- Helper to canonicalize category URLs before deduplication ---
+def normalize_category_url(url):
+    """Drops query, fragment and trailing slash so near-duplicate category links compare equal."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip('/'), '', ''))
+
+
+# --- Helper to turn a category URL into the file-name-safe stem used for error screenshots/HTML ---
+def category_artifact_name(category_url):
+    return category_url.replace('/', '_').replace(':', '_')
+
+
+# --- lxml parser target that keeps only /cn/ anchors (no tree is built for the rest of the page) ---
+class CategoryLinkCollector:
+    def __init__(self):
+        self.links = [] # (href, text) in document order
+        self._href = None
+        self._text = []
+
+    def start(self, tag, attrib):
+        if tag == 'a' and self._href is None:
+            href = attrib.get('href', '')
+            if href.startswith('/cn/'):
+                self._href = href
+                self._text = []
+
+    def end(self, tag):
+        if tag == 'a' and self._href is not None:
+            self.links.append((self._href, "".join(self._text).strip()))
+            self._href = None
+
+    def data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def close(self):
+        return self.links
+
+
+# --- Function to turn raw (href, name) category links into the deduplicated subcategory list ---
+def build_subcategory_list(category_links):
+    unique_subcategories = {}
+    base_url = "https://blinkit.com"
+    for relative_url, subcategory_name in category_links:
+        subcategory_url = normalize_category_url(base_url + relative_url)
+        # Only /cid/<l0>/<l1> pages are listing pages; anything else would just waste a PLP slot
+        if not CATEGORY_CID_RE.search(subcategory_url):
+            continue
+        # Deduplicate while iterating; the first link seen for a URL wins
+        if subcategory_url not in unique_subcategories:
+            unique_subcategories[subcategory_url] = {'name': subcategory_name, 'url': subcategory_url}
+    logging.info(f"Reduced to {len(unique_subcategories)} unique subcategory URLs.")
+    return list(unique_subcategories.values())
 
 
 # --- Function to parse category HTML (finding links by href prefix) ---
 def parse_categories_html_v2(html_content):
-    subcategories_list = []
-    base_url = "https://blinkit.com"
     logging.info("Starting HTML parsing for categories (v2).")
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        subcategory_links = soup.select('a[href^="/cn/"]')
+        # libxml2 streams the page into the collector; headers, scripts and SVGs are never materialized
+        subcategory_links = etree.fromstring(html_content, etree.HTMLParser(target=CategoryLinkCollector()))
         if not subcategory_links:
             logging.warning("No subcategory links with href starting with '/cn/' found in HTML.")
             return []
         logging.info(f"Found {len(subcategory_links)} potential subcategory links.")
-        for link in subcategory_links:
-            subcategory_name = link.text.strip()
-            relative_url = link.get('href')
-            if relative_url:
-                subcategory_url = base_url + relative_url if relative_url.startswith('/') else relative_url
-                subcategories_list.append({'name': subcategory_name, 'url': subcategory_url})
-            else:
-                logging.warning(f"Subcategory link for '{subcategory_name}' has no href attribute.")
         logging.info("Finished HTML parsing for categories (v2).")
     except Exception as e:
         logging.error(f"An unexpected error occurred during HTML parsing (v2): {e}")
         return []
-    unique_subcategories = list({subcat['url']: subcat for subcat in subcategories_list}.values())
-    logging.info(f"Reduced to {len(unique_subcategories)} unique subcategory URLs.")
-    return unique_subcategories
+    return build_subcategory_list(subcategory_links)
+
+
+# --- Playwright route handler that drops resources the scraper never looks at ---
+async def block_unneeded_resources(route, blocked_resource_types=BLOCKED_RESOURCE_TYPES):
+    request = route.request
+    if request.resource_type in blocked_resource_types or any(fragment in request.url for fragment in BLOCKED_URL_FRAGMENTS):
+        await route.abort()
+    else:
+        await route.continue_()
 
 
 # --- Function to handle initial load and location setting on the homepage (v16) ---
 async def handle_initial_load_and_location_v16(p_instance, location_query=LOCATION_QUERY):
     logging.info("Starting initial load and location handling.")
     context = None
-    user_data_dir = "./tmp_user_data"
-    os.makedirs(user_data_dir, exist_ok=True)
 
     try:
-        context = await p_instance.chromium.launch_persistent_context(
-            user_data_dir=user_data_dir,
-            headless=False, # Keep False for initial runs to debug location
-            args=['--no-sandbox', '--disable-setuid-sandbox']
-        )
+        if BLINKIT_CDP_URL:
+            # Attach to a warm browser instead of starting one. The run gets its own context, so closing it
+            # at the end leaves that browser running for the next invocation; cookies come from the snapshot.
+            browser = await p_instance.chromium.connect_over_cdp(BLINKIT_CDP_URL)
+            context = await browser.new_context(
+                storage_state=BROWSER_STATE_FILE if os.path.exists(BROWSER_STATE_FILE) else None
+            )
+            logging.info(f"Connected to running Chromium at {BLINKIT_CDP_URL}.")
+        else:
+            if BLINKIT_PROFILE_DIR:
+                user_data_dir = BLINKIT_PROFILE_DIR
+                os.makedirs(user_data_dir, exist_ok=True)
+            else:
+                user_data_dir = tempfile.mkdtemp(prefix="blinkit_profile_")
+                # Runs after asyncio.run() returns, i.e. once Playwright has shut the browser down
+                atexit.register(shutil.rmtree, user_data_dir, ignore_errors=True)
+            logging.info(f"Using Chromium profile directory: {user_data_dir}")
+            context = await p_instance.chromium.launch_persistent_context(
+                user_data_dir=user_data_dir,
+                headless=not BLINKIT_DEBUG, # Set BLINKIT_DEBUG=1 to watch the location flow in a real window
+                # Shared memory goes to the temp dir instead of /dev/shm, which is often only 64 MB in containers
+                args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+            )
+        # Context-wide, so the categories page and every pooled PLP page inherit it. Registered through a
+        # one-argument lambda: Playwright passes (route, request) to handlers with two parameters, which
+        # would land the Request in blocked_resource_types
+        await context.route("**/*", lambda route: block_unneeded_resources(route))
+
+        # A fresh or wiped profile has no Blinkit cookies; seed them from the last saved snapshot so the
+        # location check below can still skip the picker
+        if os.path.exists(BROWSER_STATE_FILE) and not await context.cookies(BLINKIT_BASE_URL):
+            try:
+                with open(BROWSER_STATE_FILE, 'rb') as f:
+                    await context.add_cookies(orjson.loads(f.read())['cookies'])
+                logging.info(f"Restored Blinkit cookies from {BROWSER_STATE_FILE}.")
+            except Exception as e:
+                logging.warning(f"Could not restore cookies from {BROWSER_STATE_FILE}: {e}")
+
         page = await context.new_page()
 
         homepage_url = "https://blinkit.com/"
@@ -93,6 +329,10 @@ async def handle_initial_load_and_location_v16(p_instance, location_query=LOCATI
         if await page.is_visible('iframe[src*="cloudflare.com/"]', timeout=5000) or \
            await page.is_visible('text=Please verify you are human', timeout=5000) or \
            await page.is_visible('text=Checking your browser before accessing', timeout=5000):
+            if not BLINKIT_DEBUG:
+                logging.error("Cloudflare or bot detection challenge detected in headless mode. Re-run with BLINKIT_DEBUG=1 to solve it in a visible window, or solve it with manual_chromium.py and run with BLINKIT_PROFILE_DIR set to its profile.")
+                await context.close()
+                return None
             logging.warning("Cloudflare or bot detection challenge detected! Please resolve it manually in the browser window.")
             logging.warning("Press Enter in your console AFTER you have resolved the CAPTCHA/challenge and the actual website content is visible.")
             await page.bring_to_front()
@@ -102,6 +342,17 @@ async def handle_initial_load_and_location_v16(p_instance, location_query=LOCATI
             logging.info("Page settled after manual resolution.")
         # --- End Cloudflare/Bot Detection Check ---
 
+        # Locality cookies carry over between runs through the BROWSER_STATE_FILE snapshot seeded above, or a
+        # BLINKIT_PROFILE_DIR profile when one is set. When the server-rendered state already carries a
+        # user-chosen (non-default) location in the requested city, skip the picker.
+        if await page.evaluate("""(locationQuery) => {
+            const coords = window.grofers?.PRELOADED_STATE?.data?.location?.coords;
+            return !!coords && coords.isDefault === false
+                && `${coords.cityName} ${coords.locality}`.toLowerCase().includes(locationQuery.toLowerCase());
+        }""", location_query):
+            logging.info("Location already set in the persisted browser profile. Skipping location picker.")
+            await page.close()
+            return context
 
         location_input_selector = 'input[name="select-locality"][placeholder*="search delivery location"]'
         location_picker_trigger_selector = 'div.LocationBar__Container-sc-x8ezho-6'
@@ -147,6 +398,8 @@ async def handle_initial_load_and_location_v16(p_instance, location_query=LOCATI
             if not await page.is_visible(r'text=/Delivery in \d+ minutes/', timeout=10000):
                  logging.warning("Did not detect 'Delivery in X minutes' text after location selection. Location might not be fully set.")
             logging.info("Location setting process completed.")
+            await context.storage_state(path=BROWSER_STATE_FILE)
+            logging.info(f"Saved browser state with the selected location to {BROWSER_STATE_FILE}.")
         else:
             logging.info("Location input field not active. Skipping typing/clicking location.")
 
@@ -162,23 +415,218 @@ async def handle_initial_load_and_location_v16(p_instance, location_query=LOCATI
         return None
 
 
+# --- Function to fetch the server-rendered categories page without opening a tab ---
+async def fetch_subcategories_direct(context):
+    """Requests /categories over the context's cookie-carrying APIRequestContext; returns [] if unusable."""
+    categories_url = "https://blinkit.com/categories"
+    try:
+        api_response = await context.request.get(categories_url, headers={'Accept': PDP_HEADERS['Accept']})
+        if not api_response.ok:
+            logging.info(f"Direct categories request returned HTTP {api_response.status}.")
+            return []
+        return parse_categories_html_v2(await api_response.body())
+    except Exception as e:
+        logging.info(f"Direct categories request failed: {e}")
+        return []
+
+
+# --- Function to read subcategory links from the categories page in the already location-set browser context ---
+async def get_subcategories_v4(context):
+    categories_url = "https://blinkit.com/categories"
+    logging.info(f"Navigating to categories page: {categories_url}")
+    page_for_categories = await context.new_page()
+    # Page-level route takes precedence over the context one; stylesheets are safe to drop here as well
+    await page_for_categories.route("**/*", lambda route: block_unneeded_resources(route, CATEGORIES_BLOCKED_RESOURCE_TYPES))
+    try:
+        await page_for_categories.goto(categories_url, wait_until='domcontentloaded', timeout=90000)
+        # The links are server-rendered, so they are usually attached by domcontentloaded; waiting for
+        # them directly returns at once instead of for networkidle, which analytics polling can delay
+        try:
+            await page_for_categories.wait_for_selector('a[href^="/cn/"]', state='attached', timeout=CATEGORY_LINKS_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            logging.warning(f"No /cn/ links attached within {CATEGORY_LINKS_TIMEOUT_MS} ms on the categories page.")
+
+        # The browser has already parsed the DOM, so read the links there instead of serializing
+        # the whole page back to Python and parsing it a second time
+        category_links = await page_for_categories.eval_on_selector_all(
+            'a[href^="/cn/"]',
+            'links => links.map(link => [link.getAttribute("href"), link.textContent.trim()])'
+        )
+        if category_links:
+            logging.info(f"Found {len(category_links)} potential subcategory links in the rendered page.")
+            return build_subcategory_list(category_links)
+
+        logging.warning("No /cn/ links found in the live DOM. Falling back to parsing the page HTML.")
+        html_content = await page_for_categories.content()
+        subcategory_urls = parse_categories_html_v2(html_content)
+        if not subcategory_urls:
+            with open("failed_categories_page_html.html", "w", encoding="utf-8") as f:
+                f.write(html_content)
+            logging.info("Saved fetched HTML to failed_categories_page_html.html for inspection.")
+        return subcategory_urls
+    except Exception as e:
+        logging.error(f"Error navigating to or reading categories page: {e}")
+        return None
+    finally:
+        await page_for_categories.close()
+
+
+# --- Helpers for the PLP listing API (the XHR that feeds the infinite scroll) ---
+def is_listing_response(response):
+    return LISTING_API_PATH in response.url and response.ok
+
+
+def extract_pids_from_listing_payload(payload):
+    """Returns (product_ids, next_url) for one listing_widgets JSON payload."""
+    response_data = payload.get('response', {})
+    # Binds the snippet's data dict once; empty-dict defaults are only built when 'identity' is missing
+    product_ids = set(
+        str(product_id)
+        for snippet in response_data.get('snippets', [])
+        if snippet.get('widget_type') == PRODUCT_SNIPPET_TYPE
+        and (data := snippet.get('data')) is not None
+        and (product_id := (data.get('identity') or {}).get('id') or data.get('product_id'))
+    )
+    next_url = response_data.get('pagination', {}).get('next_url')
+    return product_ids, next_url
+
+
+def listing_page_urls(next_url):
+    """Expands a next_url into the URLs of every remaining page, or None if it lacks the offset fields.
+
+    Blinkit's next_url carries offset/limit/page_index/total_entities_processed plus the category's
+    total_pagination_items, so later pages differ only by those counters and can be requested together.
+    """
+    parts = urlsplit(next_url)
+    query = dict(parse_qsl(parts.query))
+    try:
+        offset, limit, total = int(query['offset']), int(query['limit']), int(query['total_pagination_items'])
+        page_index = int(query.get('page_index', 0))
+        entities_processed = int(query.get('total_entities_processed', 0))
+    except (KeyError, ValueError):
+        return None
+    if limit <= 0:
+        return None
+    urls = []
+    for step, page_offset in enumerate(range(offset, total, limit)):
+        query.update(offset=page_offset, page_index=page_index + step, total_entities_processed=entities_processed + step)
+        urls.append(urlunsplit(('', '', parts.path, urlencode(query), '')))
+    return urls
+
+
+# --- Function to page through a category's listing API, starting from a response the PLP made itself ---
+async def scrape_product_ids_from_category_api(api_request, first_listing_response):
+    # Replay the page's own request shape (method, app headers, body) so the API sees a normal client.
+    # api_request is the browser context's APIRequestContext: one pooled HTTP client shared by every
+    # category, carrying the location cookies automatically.
+    listing_request = first_listing_response.request
+    product_ids, next_url = extract_pids_from_listing_payload(orjson.loads(await first_listing_response.body()))
+    pages_fetched = 1
+
+    async def fetch_listing_page(page_url):
+        # Transient failures (connection errors, 429, 5xx) are retried with backoff so one hiccup
+        # does not cost the rest of the category's pages
+        for attempt in range(LISTING_API_MAX_ATTEMPTS):
+            is_last_attempt = attempt == LISTING_API_MAX_ATTEMPTS - 1
+            try:
+                api_response = await api_request.fetch(
+                    urljoin(BLINKIT_BASE_URL, page_url),
+                    method=listing_request.method,
+                    headers=listing_request.headers,
+                    data=listing_request.post_data,
+                )
+            except PlaywrightError as e:
+                if is_last_attempt:
+                    # Treated like an empty page: pagination stops but the pages collected so far are kept
+                    logging.warning(f"Listing API request for {page_url} failed after {LISTING_API_MAX_ATTEMPTS} attempts: {e}. Stopping pagination.")
+                    return set(), None
+                backoff = LISTING_API_BACKOFF_BASE * 2 ** attempt + random.random()
+                logging.warning(f"Listing API request for {page_url} failed: {e}. Retrying in {backoff:.1f}s.")
+                await asyncio.sleep(backoff)
+                continue
+            if api_response.status not in LISTING_API_RETRY_STATUS_CODES or is_last_attempt:
+                break
+            backoff = max(LISTING_API_BACKOFF_BASE * 2 ** attempt + random.random(), retry_after_seconds(api_response))
+            logging.warning(f"Listing API returned HTTP {api_response.status} for {page_url}. Retrying in {backoff:.1f}s (attempt {attempt + 1}/{LISTING_API_MAX_ATTEMPTS}).")
+            await asyncio.sleep(backoff)
+        if not api_response.ok:
+            logging.warning(f"Listing API returned HTTP {api_response.status} for {page_url}. Stopping pagination.")
+            return set(), None
+        return extract_pids_from_listing_payload(orjson.loads(await api_response.body()))
+
+    remaining_page_urls = listing_page_urls(next_url) if next_url else None
+    if remaining_page_urls:
+        # Offsets are known up front: fetch pages in parallel waves instead of hopping next_url one by one
+        remaining_page_urls = remaining_page_urls[:MAX_LISTING_API_PAGES - 1]
+        for wave_start in range(0, len(remaining_page_urls), LISTING_API_CONCURRENCY):
+            wave = remaining_page_urls[wave_start:wave_start + LISTING_API_CONCURRENCY]
+            wave_results = await asyncio.gather(*(fetch_listing_page(page_url) for page_url in wave))
+            for page_pids, _ in wave_results:
+                product_ids.update(page_pids)
+            pages_fetched += len(wave)
+            if not all(page_pids for page_pids, _ in wave_results): # An empty page means the listing ended early
+                break
+    else:
+        while next_url and pages_fetched < MAX_LISTING_API_PAGES:
+            page_pids, next_url = await fetch_listing_page(next_url)
+            if not page_pids:
+                break
+            product_ids.update(page_pids)
+            pages_fetched += 1
+
+    logging.info(f"Listing API: collected {len(product_ids)} product IDs over {pages_fetched} pages.")
+    return product_ids
+
+
+# --- PLP selectors and page scripts, built once and reused for every category ---
+PRODUCT_LIST_CONTAINER_SELECTOR = '#plpContainer'
+PRODUCT_CARD_IN_CONTAINER_SELECTOR = 'div[id][data-pf="reset"][tabindex="0"][role="button"]'
+PRODUCT_CARD_SELECTOR = f'{PRODUCT_LIST_CONTAINER_SELECTOR} {PRODUCT_CARD_IN_CONTAINER_SELECTOR}'
+PLP_ERROR_MESSAGE_SELECTOR = r'text="Oops! Something went wrong. Please try again later."'
+PLP_SCROLL_CONTAINER_JS = f"""() => {{
+    const container = document.querySelector('{PRODUCT_LIST_CONTAINER_SELECTOR}');
+    if (container) {{
+        container.scrollTo(0, container.scrollHeight);
+    }}
+}}"""
+# Reads the seen-ID count kept by the scroll fallback's MutationObserver, then scrolls: one round trip per step
+PLP_COUNT_AND_SCROLL_JS = f"""() => {{
+    const count = window.__plpCardCount;
+    const container = document.querySelector('{PRODUCT_LIST_CONTAINER_SELECTOR}');
+    if (container) {{
+        container.scrollTo(0, container.scrollHeight);
+    }}
+    return count;
+}}"""
+# Scoped to the container rather than a document-wide descendant match on '#plpContainer ...'
+PLP_CARD_IDS_JS = f"""() => {{
+    const container = document.querySelector('{PRODUCT_LIST_CONTAINER_SELECTOR}');
+    return container ? Array.from(container.querySelectorAll('{PRODUCT_CARD_IN_CONTAINER_SELECTOR}'), card => card.id) : [];
+}}"""
+
+
 # --- Function to scrape product IDs from a category PLP using Playwright (v15) ---
 async def scrape_product_ids_from_plp_v15(page, category_url):
     logging.info(f"Navigating to category PLP: {category_url}")
+    artifact_name = category_artifact_name(category_url)
     product_ids = set()
     scroll_attempts = 0
 
-    PRODUCT_LIST_CONTAINER_SELECTOR = '#plpContainer'
-    PRODUCT_CARD_SELECTOR = f'{PRODUCT_LIST_CONTAINER_SELECTOR} div[data-pf="reset"][tabindex="0"][role="button"]'
-    error_message_selector = r'text="Oops! Something went wrong. Please try again later."'
-    
+
+    # Capture listing XHRs fired during page load; the first one seeds API pagination below
+    listing_responses = []
+    def on_listing_response(response):
+        if is_listing_response(response):
+            listing_responses.append(response)
+    page.on("response", on_listing_response)
+
     try:
         await page.goto(category_url, wait_until='domcontentloaded', timeout=90000) 
         logging.info("Category PLP DOM loaded. Checking for errors and content...")
 
-        if await page.is_visible(error_message_selector, timeout=5000):
+        if await page.is_visible(PLP_ERROR_MESSAGE_SELECTOR, timeout=5000):
             logging.error(f"PLP {category_url} showed an 'Oops' error message. Skipping this category.")
-            await page.screenshot(path=f"error_plp_{category_url.replace('/', '_').replace(':', '_')}.png")
+            await page.screenshot(path=f"error_plp_{artifact_name}.png")
             return set()
 
         logging.info(f"Waiting for product list container: {PRODUCT_LIST_CONTAINER_SELECTOR} and products to appear.")
@@ -190,215 +638,349 @@ async def scrape_product_ids_from_plp_v15(page, category_url):
             logging.info("Initial product cards appeared within container.")
         except Exception as e:
             logging.error(f"PLP {category_url} did not become ready (container/products not found) within timeout. Error: {e}")
-            await page.screenshot(path=f"plp_not_ready_{category_url.replace('/', '_').replace(':', '_')}.png")
+            await page.screenshot(path=f"plp_not_ready_{artifact_name}.png")
             return set()
 
-        previous_scroll_height = -1
+        # Fast path: follow the listing API's next_url chain instead of scrolling. If the first page was
+        # server-rendered, one scroll is enough to make the PLP issue its first listing request.
+        first_listing_response = listing_responses[0] if listing_responses else None
+        if first_listing_response is None:
+            try:
+                async with page.expect_response(is_listing_response, timeout=10000) as listing_response_info:
+                    await page.evaluate(PLP_SCROLL_CONTAINER_JS)
+                first_listing_response = await listing_response_info.value
+            except PlaywrightTimeoutError:
+                logging.info(f"No listing API request observed for {category_url}. Using DOM scrolling.")
+
+        if first_listing_response is not None:
+            try:
+                api_pids = await scrape_product_ids_from_category_api(page.context.request, first_listing_response)
+            except Exception as e:
+                logging.warning(f"Listing API pagination failed for {category_url}: {e}")
+                api_pids = set()
+            if api_pids:
+                current_category_pids = api_pids | set(filter(None, await page.evaluate(PLP_CARD_IDS_JS)))
+                logging.info(f"Extracted {len(current_category_pids)} unique product IDs from {category_url} via listing API")
+                return current_category_pids
+            logging.warning(f"Listing API yielded no product IDs for {category_url}. Falling back to DOM scrolling.")
+
+        # Accumulate every card id ever rendered into a Set on window, refreshed by a MutationObserver only
+        # when the list changes. Its size is the growth signal: unlike a live card count it keeps rising even
+        # if the list recycles off-screen cards, and the wait below polls a plain variable.
+        await page.evaluate("""([containerSelector, cardSelector]) => {
+            const container = document.querySelector(containerSelector);
+            window.__plpCardIds = new Set();
+            const collectIds = () => {
+                for (const card of container.querySelectorAll(cardSelector)) {
+                    if (card.id) window.__plpCardIds.add(card.id);
+                }
+                window.__plpCardCount = window.__plpCardIds.size;
+            };
+            collectIds();
+            new MutationObserver(collectIds).observe(container, { childList: true, subtree: true });
+        }""", [PRODUCT_LIST_CONTAINER_SELECTOR, PRODUCT_CARD_IN_CONTAINER_SELECTOR])
+
         while scroll_attempts < MAX_PLP_SCROLL_ATTEMPTS:
-            if await page.is_visible(error_message_selector, timeout=1000):
+            if await page.is_visible(PLP_ERROR_MESSAGE_SELECTOR, timeout=1000):
                 logging.error(f"PLP {category_url} showed an 'Oops' error message during scrolling. Stopping for this category.")
-                await page.screenshot(path=f"error_scrolling_plp_{category_url.replace('/', '_').replace(':', '_')}.png")
-                break
-
-            current_scroll_height = await page.evaluate(f"document.querySelector('{PRODUCT_LIST_CONTAINER_SELECTOR}').scrollHeight")
-            
-            if current_scroll_height == previous_scroll_height and scroll_attempts > 0:
-                logging.info(f"No new scroll height detected ({current_scroll_height}px). Assuming end of category.")
+                await page.screenshot(path=f"error_scrolling_plp_{artifact_name}.png")
                 break
 
-            previous_scroll_height = current_scroll_height
+            current_product_count = await page.evaluate(PLP_COUNT_AND_SCROLL_JS)
+            logging.debug(f"Scroll attempt {scroll_attempts + 1}: Unique product IDs so far: {current_product_count}")
 
-            await page.evaluate(f"""() => {{
-                const container = document.querySelector('{PRODUCT_LIST_CONTAINER_SELECTOR}');
-                if (container) {{
-                    container.scrollTo(0, container.scrollHeight);
-                }}
-            }}""")
-            
+            # Resolves as soon as the lazy loader appends cards; no growth within the timeout means the end
             try:
-                await page.wait_for_load_state('networkidle', timeout=10000)
-            except Exception:
-                logging.warning(f"Network idle timeout after scroll for {category_url}. Continuing but may indicate slow loading.")
-            
-            await asyncio.sleep(random.uniform(1, 3))
-
-            current_product_count = len(await page.query_selector_all(PRODUCT_CARD_SELECTOR))
-            logging.info(f"Scroll attempt {scroll_attempts + 1}: Current product count: {current_product_count}")
+                await page.wait_for_function("(previousCount) => window.__plpCardCount > previousCount", arg=current_product_count, timeout=PLP_SCROLL_GROWTH_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                logging.info(f"No new product IDs after scrolling ({current_product_count} IDs). Assuming end of category.")
+                break
 
             scroll_attempts += 1
 
 
         logging.info(f"Finished scrolling after {scroll_attempts} attempts (max {MAX_PLP_SCROLL_ATTEMPTS}).")
 
-        final_cards = await page.query_selector_all(PRODUCT_CARD_SELECTOR)
-        logging.info(f"Total product cards found after scrolling: {len(final_cards)}")
+        # Collect every id seen while scrolling in one round trip instead of one get_attribute call per card
+        card_ids = await page.evaluate("() => Array.from(window.__plpCardIds)")
+        logging.info(f"Total product cards found after scrolling: {len(card_ids)}")
 
-        current_category_pids = set()
-        for card in final_cards:
-            product_id = await card.get_attribute('id')
-            if product_id:
-                current_category_pids.add(product_id)
+        current_category_pids = set(card_ids)
 
         logging.info(f"Extracted {len(current_category_pids)} unique product IDs from {category_url}")
         return current_category_pids
 
     except Exception as e:
         logging.error(f"An error occurred while scraping PLP {category_url}: {e}")
-        await page.screenshot(path=f"general_error_plp_{category_url.replace('/', '_').replace(':', '_')}.png")
+        await page.screenshot(path=f"general_error_plp_{artifact_name}.png")
         return set()
+    finally:
+        page.remove_listener("response", on_listing_response) # Pages are pooled; don't leak handlers
+
+
+# --- Helper to parse the free-text 'Nutrition Information' attribute into a dict ---
+def parse_nutrition_info(nutrition_text):
+    """Parses an optional leading 'Per <serving>' line plus 'key: value' lines into a dict."""
+    parsed_nutrition = {}
+    if not nutrition_text:
+        return parsed_nutrition
+    lines = nutrition_text.split('\n')
+    if lines[0].startswith('Per '):
+        parsed_nutrition['serving_size'] = lines[0][4:].strip()
+        lines = lines[1:]
+    # partition() is one C-level scan per line; lines without a colon come back with an empty separator
+    for line in lines:
+        key, separator, value = line.partition(':')
+        if separator:
+            parsed_nutrition[key.strip()] = value.strip()
+    return parsed_nutrition
+
+
+# --- Adaptive pacing for PDP requests: speeds up while healthy, backs off when throttled ---
+def retry_after_seconds(response):
+    """Returns a numeric Retry-After header as seconds, or 0.0 when absent or given as a date.
+
+    Works for httpx responses and Playwright API responses, whose header names are lower-cased.
+    """
+    retry_after = response.headers.get('retry-after', '')
+    return float(retry_after) if retry_after.isdigit() else 0.0
+
+
+class AdaptiveDelay:
+    """Token bucket shared by all PDP workers: one request start per `delay` seconds, up to `burst` at once.
+
+    The delay is halved on success and doubled on 429/503 (Retry-After wins if longer).
+    """
+
+    def __init__(self, initial=PDP_DELAY_INITIAL, minimum=PDP_DELAY_MIN, maximum=PDP_DELAY_MAX, burst=PDP_BURST):
+        self.delay = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.burst = burst
+        self.next_start = 0.0
+
+    async def wait(self):
+        # Each caller reserves the next free start time, so workers are spaced evenly instead of
+        # each sleeping its own jittered delay; unused slots from an idle stretch bank up to `burst`
+        now = asyncio.get_running_loop().time()
+        start = max(self.next_start, now - (self.burst - 1) * self.delay)
+        self.next_start = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def record(self, response):
+        if response.status_code in THROTTLE_STATUS_CODES:
+            self.delay = max(min(self.delay * 2, self.maximum), retry_after_seconds(response))
+            logging.warning(f"Throttled with HTTP {response.status_code}. PDP delay is now {self.delay:.2f}s.")
+        elif response.is_success or response.status_code == 304: # A revalidated cache hit is a success too
+            self.delay = max(self.delay / 2, self.minimum)
+
+
+# --- Helper to build the pooled HTTP client shared by all PDP fetches ---
+def create_pdp_client():
+    """Returns an HTTP/2 AsyncClient with keep-alive pooling, default headers, a timeout and connect retries."""
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=PDP_MAX_CONNECTIONS,
+            max_keepalive_connections=PDP_MAX_CONNECTIONS,
+            keepalive_expiry=PDP_KEEPALIVE_SECONDS,
+        ),
+        retries=PDP_CONNECT_RETRIES,
+    )
+    return httpx.AsyncClient(transport=transport, headers=PDP_HEADERS, timeout=PDP_TIMEOUT_SECONDS, follow_redirects=True)
+
+
+# --- Helper to slice the PRELOADED_STATE JSON out of raw page bytes with plain bytes searches ---
+def find_preloaded_state(page_bytes):
+    """Returns the state's JSON bytes, or None if the page has no PRELOADED_STATE assignment."""
+    marker_at = page_bytes.find(PRELOADED_STATE_MARKER)
+    if marker_at == -1:
+        return None
+    json_start = page_bytes.find(b'{', marker_at)
+    script_end = page_bytes.find(b'</script>', json_start)
+    if json_start == -1 or script_end == -1:
+        return None
+    # The literal ends at the first '}' (optionally followed by ';') that precedes the next
+    # window.* assignment, or the closing tag if nothing else is assigned in the same script
+    boundary = page_bytes.find(b'window.', json_start, script_end)
+    while True:
+        json_end = (boundary if boundary != -1 else script_end) - 1
+        while page_bytes[json_end] in b' \t\r\n':
+            json_end -= 1
+        if page_bytes[json_end] == ord(';'):
+            json_end -= 1
+            while page_bytes[json_end] in b' \t\r\n':
+                json_end -= 1
+        if page_bytes[json_end] == ord('}') or boundary == -1:
+            return page_bytes[json_start:json_end + 1]
+        boundary = page_bytes.find(b'window.', boundary + 1, script_end) # 'window.' inside a string value
+
+
+# --- Function to extract variant records from raw PDP HTML (pure CPU, runs off the event loop) ---
+def parse_pdp_html(page_bytes, product_id, product_url):
+    product_data = []
+    state_json = find_preloaded_state(page_bytes)
+    if state_json is None:
+        logging.error(f"Could not find PRELOADED_STATE script tag on {product_url} (ID: {product_id})")
+        return []
+    state_data = orjson.loads(state_json)
+    # One indexed walk instead of a .get(..., {}) chain that allocates an empty dict per missing level.
+    # The PDP payload sits under the top-level 'ui' key, a sibling of 'data', not inside it.
+    try:
+        pdp_raw_data = state_data['ui']['pdp']['rawData']['data'] or {}
+    except (KeyError, TypeError):
+        pdp_raw_data = {}
+    # Only the PDP sub-tree is used below; drop the rest of the state (cart, user, layout, ...) right away
+    # so it is freed before variant records are built, lowering peak memory with many PDPs in flight
+    del state_data, state_json
+    variants_info = pdp_raw_data.get('variants_info', [])
+    if not variants_info:
+         single_product_data = pdp_raw_data.get('product')
+         if single_product_data:
+              variants_info = [single_product_data]
+              logging.warning(f"variants_info not found for ID {product_id}, using single product data as fallback.")
+         else:
+            logging.error(f"No variant or single product data found in PRELOADED_STATE for ID {product_id}")
+            return []
+    for variant in variants_info:
+        variant_product_id = variant.get('id') or variant.get('product_id') or product_id
+        if not variant_product_id:
+             logging.warning(f"Skipping variant due to missing product_id for group ID {product_id}: {variant.get('name')}")
+             continue
+        level0_category = variant.get('level0_category')
+        level1_category = variant.get('level1_category')
+        image_urls = []
+        for item in variant.get('assets') or ():
+            if not item or item.get('media_type') != 'image':
+                continue
+            image = item.get('image')
+            image_url = image and image.get('url')
+            if image_url:
+                image_urls.append(image_url)
+        variant_data = {
+            'product_id': variant_product_id,
+            'group_id': variant.get('group_id'),
+            'name': variant.get('name'),
+            'brand': variant.get('brand'),
+            'category_l0': level0_category[0].get('name') if level0_category else None,
+            'category_l1': level1_category[0].get('name') if level1_category else None,
+            'unit': variant.get('unit'),
+            'price': variant.get('price'),
+            'original_price': variant.get('mrp'),
+            'inventory': variant.get('inventory'),
+            'product_url': product_url,
+            'image_urls': image_urls,
+            'nutrition_info': None,
+            'ingredients': None,
+            'key_features': None
+        }
+        # Stop scanning once every wanted attribute is filled; the rest of the collections is never read
+        fields_found = set()
+        for collection in variant.get('attribute_collection') or ():
+            for attr in collection.get('attributes') or ():
+                if (field := PDP_ATTRIBUTE_FIELDS.get(attr.get('title'))) and field not in fields_found and (value := attr.get('value')):
+                    variant_data[field] = value.strip()
+                    fields_found.add(field)
+                    if len(fields_found) == len(PDP_ATTRIBUTE_FIELDS):
+                        break
+            else:
+                continue
+            break
+        variant_data['nutrition_info'] = parse_nutrition_info(variant_data.get('nutrition_info'))
+        product_data.append(variant_data)
+    logging.debug(f"Successfully extracted data for {len(product_data)} variants from PDP ID {product_id}")
+    return product_data
 
 
-# --- Function to scrape detailed data from a PDP using requests and JSON (no change) ---
-def scrape_detailed_product_data(product_id):
-    product_data = []
-    logging.info(f"Fetching detailed data for PDP ID: {product_id}")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://blinkit.com/',
-        'DNT': '1',
-        'Connection': 'keep-alive',
-    }
+# --- Function to scrape detailed data from a PDP using a shared async httpx client and JSON ---
+async def scrape_detailed_product_data(client, product_id, pacer=None, cached_pdp=None):
+    """Returns (variants, (etag, last_modified)); variants is empty on failure.
+
+    cached_pdp is an expired (etag, last_modified, variants) cache row; its validators are sent as a
+    conditional GET and a 304 reuses its variants without downloading or parsing the page again.
+    """
+    logging.debug(f"Fetching detailed data for PDP ID: {product_id}")
+    product_url = PDP_URL_FMT(product_id)
+    request_headers = {}
+    if cached_pdp:
+        if cached_pdp[0]:
+            request_headers['If-None-Match'] = cached_pdp[0]
+        if cached_pdp[1]:
+            request_headers['If-Modified-Since'] = cached_pdp[1]
     try:
-        product_url = f"https://blinkit.com/prn/product/prid/{product_id}"
-        response = requests.get(product_url, headers=headers, timeout=30)
+        for attempt in range(PDP_MAX_ATTEMPTS):
+            if pacer:
+                await pacer.wait()
+            response = await client.get(product_url, headers=request_headers)
+            if pacer:
+                pacer.record(response)
+            if response.status_code not in THROTTLE_STATUS_CODES or attempt == PDP_MAX_ATTEMPTS - 1:
+                break
+            backoff = max(PDP_BACKOFF_BASE * 2 ** attempt + random.random(), retry_after_seconds(response))
+            logging.warning(f"HTTP {response.status_code} for PDP ID {product_id}. Retrying in {backoff:.1f}s (attempt {attempt + 1}/{PDP_MAX_ATTEMPTS}).")
+            await asyncio.sleep(backoff)
+        if response.status_code == 304 and cached_pdp:
+            logging.debug(f"PDP ID {product_id} not modified; reusing cached data.")
+            return cached_pdp[2], cached_pdp[:2]
         response.raise_for_status()
-        if '/prid/' not in response.url:
+        if '/prid/' not in response.url.path:
              logging.warning(f"Redirected away from expected PDP URL pattern for ID {product_id}. Final URL: {response.url}")
-             return []
-        soup = BeautifulSoup(response.content, 'lxml')
-        script_tag = soup.find('script', string=re.compile(r'window\.grofers\.PRELOADED_STATE = \{'))
-        if not script_tag:
-            logging.error(f"Could not find PRELOADED_STATE script tag on {product_url} (ID: {product_id})")
-            return []
-        json_string = script_tag.string
-        json_string = json_string.replace('window.grofers.PRELOADED_STATE = ', '').strip()
-        if json_string.endswith(';'):
-            json_string = json_string[:-1]
-        state_data = json.loads(json_string)
-        variants_info = state_data.get('data', {}).get('ui', {}).get('pdp', {}).get('rawData', {}).get('data', {}).get('variants_info', [])
-        if not variants_info:
-             single_product_data = state_data.get('data', {}).get('ui', {}).get('pdp', {}).get('rawData', {}).get('data', {}).get('product')
-             if single_product_data:
-                  variants_info = [single_product_data]
-                  logging.warning(f"variants_info not found for ID {product_id}, using single product data as fallback.")
-             else:
-                logging.error(f"No variant or single product data found in PRELOADED_STATE for ID {product_id}")
-                return []
-        for variant in variants_info:
-            variant_product_id = variant.get('id') or variant.get('product_id') or product_id
-            if not variant_product_id:
-                 logging.warning(f"Skipping variant due to missing product_id for group ID {product_id}: {variant.get('name')}")
-                 continue
-            variant_data = {
-                'product_id': variant_product_id,
-                'group_id': variant.get('group_id'),
-                'name': variant.get('name'),
-                'brand': variant.get('brand'),
-                'category_l0': variant.get('level0_category', [{}])[0].get('name') if variant.get('level0_category') else None,
-                'category_l1': variant.get('level1_category', [{}])[0].get('name') if variant.get('level1_category') else None,
-                'unit': variant.get('unit'),
-                'price': variant.get('price'),
-                'original_price': variant.get('mrp'),
-                'inventory': variant.get('inventory'),
-                'product_url': response.url,
-                'image_urls': [item.get('image', {}).get('url') for item in variant.get('assets', []) if item and item.get('media_type') == 'image' and item.get('image', {}).get('url')],
-                'nutrition_info': None,
-                'ingredients': None,
-                'key_features': None
-            }
-            attribute_collections = variant.get('attribute_collection', [])
-            for collection in attribute_collections:
-                attributes = collection.get('attributes', [])
-                for attr in attributes:
-                    if attr.get('title') == 'Nutrition Information' and attr.get('value'):
-                         variant_data['nutrition_info'] = attr.get('value').strip()
-                    elif attr.get('title') == 'Ingredients' and attr.get('value'):
-                         variant_data['ingredients'] = attr.get('value').strip()
-                    elif attr.get('title') == 'Key Features' and attr.get('value'):
-                         variant_data['key_features'] = attr.get('value').strip()
-            parsed_nutrition = {}
-            nutrition_text = variant_data.get('nutrition_info')
-            if nutrition_text:
-                lines = nutrition_text.split('\n')
-                if lines:
-                    serving_size_line = lines[0]
-                    serving_size_match = re.match(r'Per (.*)', serving_size_line)
-                    if serving_size_match:
-                        parsed_nutrition['serving_size'] = serving_size_match.group(1).strip()
-                        lines = lines[1:]
-                for line in lines:
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        parsed_nutrition[key.strip()] = value.strip()
-            variant_data['nutrition_info'] = parsed_nutrition
-            product_data.append(variant_data)
-        logging.info(f"Successfully extracted data for {len(product_data)} variants from PDP ID {product_id}")
-    except requests.exceptions.RequestException as e:
+             return [], None
+        validators = (response.headers.get('etag'), response.headers.get('last-modified'))
+        # Regex + JSON decode + record building is the CPU-heavy part; keep it off the event loop
+        # so other in-flight PDP requests keep progressing while this page is parsed
+        return await asyncio.to_thread(parse_pdp_html, response.content, product_id, str(response.url)), validators
+    except httpx.HTTPStatusError as e:
+        # One line with the ID and status code: str(e) spans two lines, and extract_pids.py scans these lines
+        logging.error(f"Error fetching PDP URL {product_url} (ID: {product_id}): HTTP Status Code: {e.response.status_code} {e.response.reason_phrase}")
+        return [], None
+    except httpx.HTTPError as e:
         logging.error(f"Error fetching PDP URL {product_url} (ID: {product_id}): {e}")
-        if hasattr(e, 'response') and e.response is not None:
-             logging.error(f"HTTP Status Code: {e.response.status_code}")
-        return []
-    except json.JSONDecodeError as e:
+        return [], None
+    except orjson.JSONDecodeError as e:
         logging.error(f"Error decoding JSON from PRELOADED_STATE on PDP URL {product_url} (ID: {product_id}): {e}")
-        return []
+        return [], None
     except Exception as e:
         logging.error(f"An unexpected error occurred during PDP scraping for URL {product_url} (ID: {product_id}): {e}")
-        return []
-    return product_data
+        return [], None
 
 
 # --- Main execution block ---
 async def main():
-    # Clear incremental PID file at start of new full run (or comment out to resume)
-    # This should be done only if you want a fresh run.
-    # If you want to resume, comment out these lines.
-    if os.path.exists(CATEGORIZED_PIDS_FILE):
+    # Clear incremental PID file at start of new full run.
+    # Set BLINKIT_RESUME=1 to keep it and skip the categories it already has PIDs for.
+    if not BLINKIT_RESUME and os.path.exists(CATEGORIZED_PIDS_FILE):
         os.remove(CATEGORIZED_PIDS_FILE)
         logging.info(f"Cleared previous categorized PIDs file: {CATEGORIZED_PIDS_FILE}")
 
 
     # Use async_playwright context manager at the top level for a single Playwright instance
     async with async_playwright() as p:
-        # Step 0: Handle initial load and location setting, get a persistent browser context
+        # Step 0: Handle initial load and location setting, get the browser context used for the whole run
         browser_context_for_all_scraping = await handle_initial_load_and_location_v16(p, location_query=LOCATION_QUERY)
 
         if not browser_context_for_all_scraping:
-            logging.error("Failed to get a persistent browser context with location set. Exiting.")
+            logging.error("Failed to get a browser context with location set. Exiting.")
             return
 
-        # Now, use this single persistent context for all subsequent Playwright operations
+        # Now, use this single context for all subsequent Playwright operations
         # (categories page and PLP scraping)
 
-        # Step 1: Get HTML for categories page (now that location is set)
-        categories_url = "https://blinkit.com/categories"
-        logging.info(f"Navigating to categories page: {categories_url}")
-        page_for_categories = await browser_context_for_all_scraping.new_page()
-        try:
-            await page_for_categories.goto(categories_url, wait_until='domcontentloaded', timeout=90000)
-            await page_for_categories.wait_for_load_state('load', timeout=30000)
-            await page_for_categories.wait_for_load_state('networkidle', timeout=30000)
-            html_content = await page_for_categories.content()
-            logging.info(f"Fetched {len(html_content)} bytes of rendered HTML for categories page.")
-        except Exception as e:
-            logging.error(f"Error navigating to or fetching categories page: {e}")
-            html_content = None
-        finally:
-            await page_for_categories.close()
+        # Step 1: Get subcategory links from the categories page (now that location is set).
+        # Try the plain server-rendered HTML first; render the page in a tab only when it has no links.
+        subcategory_urls = await fetch_subcategories_direct(browser_context_for_all_scraping)
+        if not subcategory_urls:
+            logging.info("No subcategory links in the direct response. Rendering the categories page instead.")
+            subcategory_urls = await get_subcategories_v4(browser_context_for_all_scraping)
 
-        if not html_content:
-            logging.error("Could not get HTML content for categories page. Exiting.")
+        if subcategory_urls is None:
+            logging.error("Could not load the categories page. Exiting.")
             await browser_context_for_all_scraping.close()
             return
 
-        subcategory_urls = parse_categories_html_v2(html_content)
-
         if not subcategory_urls:
             logging.error("No subcategory URLs found on the categories page. Exiting.")
-            with open("failed_categories_page_html.html", "w", encoding="utf-8") as f:
-                f.write(html_content)
-            logging.info("Saved fetched HTML to failed_categories_page_html.html for inspection.")
             await browser_context_for_all_scraping.close()
             return
 
@@ -408,69 +990,106 @@ async def main():
         all_categorized_product_ids = {}
         total_unique_pids_overall = set()
 
-        # Load existing categorized PIDs if file exists (for resuming)
+        # Load existing categorized PIDs if file exists (for resuming). Later lines for the same
+        # category replace earlier ones; a line cut short by a crash is skipped.
         if os.path.exists(CATEGORIZED_PIDS_FILE):
             try:
-                with open(CATEGORIZED_PIDS_FILE, 'r', encoding='utf-8') as f:
-                    loaded_data = json.load(f)
-                    for cat_url, cat_info in loaded_data.items():
-                        all_categorized_product_ids[cat_url] = {'name': cat_info['name'], 'pids': set(cat_info['pids'])}
-                        total_unique_pids_overall.update(cat_info['pids'])
+                with open(CATEGORIZED_PIDS_FILE, 'rb') as f:
+                    for line in f:
+                        try:
+                            cat_info = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            logging.warning(f"Skipping unreadable line in {CATEGORIZED_PIDS_FILE}.")
+                            continue
+                        all_categorized_product_ids[cat_info['url']] = {'name': cat_info['name'], 'pids': intern_pids(cat_info['pids'])}
+                for cat_info in all_categorized_product_ids.values():
+                    total_unique_pids_overall.update(cat_info['pids'])
                 logging.info(f"Loaded {len(all_categorized_product_ids)} categories from {CATEGORIZED_PIDS_FILE}. Total {len(total_unique_pids_overall)} unique PIDs.")
-            except json.JSONDecodeError as e:
-                logging.warning(f"Could not load {CATEGORIZED_PIDS_FILE} (JSON error: {e}). Starting fresh for PIDs.")
             except Exception as e:
                 logging.warning(f"Could not load {CATEGORIZED_PIDS_FILE} (Error: {e}). Starting fresh for PIDs.")
+                all_categorized_product_ids.clear()
+                total_unique_pids_overall.clear()
 
 
         # Step 2: Scrape product IDs from each category PLP concurrently using Playwright
         logging.info(f"Starting to scrape product IDs from category PLPs using Playwright (Concurrency: {PLP_CONCURRENCY})...")
         
-        semaphore_plp = asyncio.Semaphore(PLP_CONCURRENCY)
+        # A fixed pool of pages shared by all PLP tasks; the queue size is the concurrency limit.
+        # All pages live in the one location-set context, so cookies are shared and never re-set.
+        page_pool = asyncio.Queue()
+        for _ in range(PLP_CONCURRENCY):
+            page_pool.put_nowait(await browser_context_for_all_scraping.new_page())
+        category_cache = open_pdp_cache()
+        categorized_pids_file = open(CATEGORIZED_PIDS_FILE, 'ab')
 
         async def scrape_plp_task_wrapper(context_for_task, subcategory_data):
-            async with semaphore_plp:
-                category_url = subcategory_data['url']
-                category_name = subcategory_data['name']
-                
-                # Skip if this category was already processed and has PIDs
-                if category_url in all_categorized_product_ids and all_categorized_product_ids[category_url]['pids']:
-                    logging.info(f"Skipping already scraped category: {category_name} ({category_url})")
-                    return # Just return, the main dict is already updated
-
-                page = await context_for_task.new_page()
-                pids_for_this_category = set()
-                try:
-                    pids_for_this_category = await scrape_product_ids_from_plp_v15(page, category_url) # Use v15
-                    
-                    all_categorized_product_ids[category_url] = {'name': category_name, 'pids': pids_for_this_category}
-                    total_unique_pids_overall.update(pids_for_this_category)
-
-                    save_pids_incrementally(all_categorized_product_ids)
-
-                except Exception as e:
-                    logging.error(f"Error scraping PLP for {category_name} ({category_url}): {e}")
-                    all_categorized_product_ids[category_url] = {'name': category_name, 'pids': set()} 
-                    save_pids_incrementally(all_categorized_product_ids) 
-                    try: 
-                        await page.screenshot(path=f"task_error_plp_{category_url.replace('/', '_').replace(':', '_')}.png")
-                        with open(f"task_error_plp_{category_url.replace('/', '_').replace(':', '_')}.html", "w", encoding="utf-8") as f:
-                            f.write(await page.content())
-                    except Exception as screenshot_e:
-                        logging.warning(f"Could not save screenshot/HTML for error: {screenshot_e}")
-                finally:
-                    await page.close()
-                    logging.info(f"Finished scraping PLP: {category_name}. Total unique PIDs found so far: {len(total_unique_pids_overall)}")
-                    await asyncio.sleep(random.uniform(2, 5)) 
-                
-                return # Task completes
+            category_url = subcategory_data['url']
+            category_name = subcategory_data['name']
+
+            cached_pids = load_cached_category_pids(category_cache, category_url)
+            if cached_pids is not None:
+                cached_pids = intern_pids(cached_pids)
+                logging.info(f"Using cached PIDs for category: {category_name} ({len(cached_pids)} PIDs)")
+                all_categorized_product_ids[category_url] = {'name': category_name, 'pids': cached_pids}
+                total_unique_pids_overall.update(cached_pids)
+                save_pids_incrementally(categorized_pids_file, category_url, category_name, cached_pids)
+                return
+
+            page = await page_pool.get()
+            pids_for_this_category = set()
+            try:
+                pids_for_this_category = intern_pids(await scrape_product_ids_from_plp_v15(page, category_url)) # Use v15
 
+                all_categorized_product_ids[category_url] = {'name': category_name, 'pids': pids_for_this_category}
+                total_unique_pids_overall.update(pids_for_this_category)
+                if pids_for_this_category: # Empty results are not cached so the category is retried next run
+                    store_cached_category_pids(category_cache, category_url, pids_for_this_category)
 
+                save_pids_incrementally(categorized_pids_file, category_url, category_name, pids_for_this_category)
+
+            except Exception as e:
+                logging.error(f"Error scraping PLP for {category_name} ({category_url}): {e}")
+                all_categorized_product_ids[category_url] = {'name': category_name, 'pids': set()}
+                save_pids_incrementally(categorized_pids_file, category_url, category_name, ())
+                try:
+                    artifact_name = category_artifact_name(category_url)
+                    await page.screenshot(path=f"task_error_plp_{artifact_name}.png")
+                    with open(f"task_error_plp_{artifact_name}.html", "w", encoding="utf-8") as f:
+                        f.write(await page.content())
+                except Exception as screenshot_e:
+                    logging.warning(f"Could not save screenshot/HTML for error: {screenshot_e}")
+            finally:
+                logging.info(f"Finished scraping PLP: {category_name}. Total unique PIDs found so far: {len(total_unique_pids_overall)}")
+                if not page.is_closed():
+                    # Unload the PLP so its timers and background requests stop while the page waits in the pool
+                    try:
+                        await page.goto('about:blank')
+                    except Exception as e:
+                        logging.warning(f"Could not reset pooled page to about:blank: {e}")
+                        await page.close()
+                if page.is_closed(): # Replace pages that crashed so the pool never shrinks
+                    page = await context_for_task.new_page()
+                page_pool.put_nowait(page)
+
+            return # Task completes
+
+
+        # Categories loaded from a resumed run with PIDs are skipped before any task is created
+        already_scraped_urls = {url for url, cat_info in all_categorized_product_ids.items() if cat_info['pids']}
+        if already_scraped_urls:
+            logging.info(f"Skipping {len(already_scraped_urls)} categories already scraped in a previous run.")
         tasks_plp = [
             scrape_plp_task_wrapper(browser_context_for_all_scraping, subcategory)
             for subcategory in subcategory_urls
+            if subcategory['url'] not in already_scraped_urls
         ]
-        await asyncio.gather(*tasks_plp)
+        try:
+            await asyncio.gather(*tasks_plp)
+        finally:
+            category_cache.close()
+            categorized_pids_file.close()
+        # Resumed runs append over older lines; after a clean PLP phase keep only the latest per category
+        compact_categorized_pids(all_categorized_product_ids)
 
         await browser_context_for_all_scraping.close()
         logging.info("Browser context closed after all PLP scraping tasks.")
@@ -480,35 +1099,76 @@ async def main():
 
     # Step 3: Fetch detailed data for each unique product ID (from PDP URLs)
     logging.info(f"Starting to scrape detailed data from PDP IDs (Concurrency: {PDP_CONCURRENCY})...")
-    all_detailed_product_data = []
+    total_variants_scraped = 0
 
     product_ids_list = list(total_unique_pids_overall)
 
-    semaphore_pdp = asyncio.Semaphore(PDP_CONCURRENCY)
-
-    async def scrape_pdp_task_wrapper(product_id):
-        async with semaphore_pdp:
-            loop = asyncio.get_running_loop()
-            detailed_data = await loop.run_in_executor(None, scrape_detailed_product_data, product_id)
-            return detailed_data
-
-    pdp_tasks = [scrape_pdp_task_wrapper(pid) for pid in product_ids_list]
-    results = await asyncio.gather(*pdp_tasks)
-
-    for data_list in results:
-        all_detailed_product_data.extend(data_list)
-
-    logging.info(f"\nFinished scraping detailed data from {len(product_ids_list)} PDPs. Total variants/products scraped: {len(all_detailed_product_data)}")
+    pdp_pacer = AdaptiveDelay() # PDP_CONCURRENCY workers cap requests in flight; the pacer caps the start rate
+    pdp_cache = open_pdp_cache()
+    uncommitted_cache_rows = 0
+    failed_product_ids = [] # PIDs that produced no variants after retries; written out for a targeted re-run
+    covered_product_ids = set() # Every variant ID already written; a PDP returns all variants of its group
+
+    # Variants are streamed to a JSON Lines file as each PDP finishes, so memory stays flat
+    # regardless of catalog size and a crash keeps everything written up to that point
+    with open(FULL_PRODUCT_DATA_FILE, 'wb', buffering=OUTPUT_BUFFER_BYTES) as product_data_file:
+
+        # One client for the whole PDP phase so connections (and HTTP/2 streams) are reused across PIDs
+        async with create_pdp_client() as pdp_client:
+
+            async def scrape_pdp_task_wrapper(product_id):
+                nonlocal uncommitted_cache_rows, total_variants_scraped
+                if product_id in covered_product_ids:
+                    logging.debug(f"Skipping PDP ID {product_id}: already scraped as a variant of another product.")
+                    return
+                detailed_data = load_cached_pdp(pdp_cache, product_id)
+                if detailed_data is not None:
+                    logging.debug(f"Using cached PDP data for ID: {product_id}")
+                else:
+                    stale_pdp = load_revalidatable_pdp(pdp_cache, product_id)
+                    detailed_data, validators = await scrape_detailed_product_data(pdp_client, product_id, pdp_pacer, stale_pdp)
+
+                    # Only successful scrapes are cached so failed PIDs are retried on the next run
+                    if not detailed_data:
+                        failed_product_ids.append(product_id)
+                    else:
+                        store_cached_pdp(pdp_cache, product_id, detailed_data, validators)
+                        uncommitted_cache_rows += 1
+                        if uncommitted_cache_rows >= PDP_CACHE_COMMIT_EVERY:
+                            pdp_cache.commit()
+                            uncommitted_cache_rows = 0
+
+                for variant in detailed_data:
+                    covered_product_ids.add(str(variant['product_id']))
+                    product_data_file.write(orjson.dumps(variant, option=orjson.OPT_APPEND_NEWLINE))
+                total_variants_scraped += len(detailed_data)
+
+            # A fixed set of workers pulls PIDs from one shared iterator, so only PDP_CONCURRENCY
+            # coroutines exist at a time instead of one per PID created up front
+            async def pdp_worker(product_id_iter):
+                for product_id in product_id_iter:
+                    await scrape_pdp_task_wrapper(product_id)
+
+            product_id_iter = iter(product_ids_list)
+            try:
+                await asyncio.gather(*(pdp_worker(product_id_iter) for _ in range(PDP_CONCURRENCY)))
+            finally:
+                pdp_cache.commit()
+                pdp_cache.close()
 
+    logging.info(f"\nFinished scraping detailed data from {len(product_ids_list)} PDPs. Total variants/products scraped: {total_variants_scraped}")
 
-    if all_detailed_product_data:
-        output_filename = FULL_PRODUCT_DATA_FILE
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(all_detailed_product_data, f, indent=4)
-        logging.info(f"Saved all scraped product data to {output_filename}")
+    if total_variants_scraped:
+        logging.info(f"Saved all scraped product data to {FULL_PRODUCT_DATA_FILE}")
     else:
         logging.warning("No detailed product data was scraped.")
 
+    # Written on every run ([] when nothing failed) so a previous run's failures never look current
+    with open(FAILED_PDP_IDS_FILE, 'wb') as f:
+        f.write(orjson.dumps(failed_product_ids))
+    if failed_product_ids:
+        logging.warning(f"{len(failed_product_ids)} PDPs produced no data. Their IDs were saved to {FAILED_PDP_IDS_FILE}.")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
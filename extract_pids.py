@@ -1,10 +1,21 @@
 import re
 import os
+import mmap
 import logging
 
 # --- Configuration ---
 LOG_FILE_PATH = "scrapfetchlogs.log"
 FAILED_PIDS_FILE_PATH = "failed_pids_from_log.txt" # Output file for the extracted PIDs
+LOG_READ_CHUNK_BYTES = 4 * 1024 * 1024 # Read size when the log cannot be memory-mapped
+
+# Regex to specifically match the error lines and capture the PID from "(ID: XXXXXX)"
+# It looks for "Error fetching PDP URL", then any characters on the same line, then "(ID: " followed by
+# digits (captured group 1), then "):", then any characters on the same line, then either the current
+# scraper's "HTTP Status Code: 403" or the older requests-based "403 Client Error: Forbidden".
+# It is a bytes pattern run over the whole log (mapped or in large chunks), so [^\n]* keeps each match within one line.
+PID_PATTERN = re.compile(
+    rb"Error fetching PDP URL [^\n]* \(ID: (\d+)\): [^\n]*(?:HTTP Status Code: 403\b|403 Client Error: Forbidden)"
+)
 
 # Set up a basic logger for this script
 logging.basicConfig(
@@ -12,10 +23,33 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+def scan_failed_pids_in_chunks(log_file):
+    """
+    Extracts failed PIDs from a binary log stream read in large chunks, for inputs that cannot be
+    memory-mapped (empty files, pipes). Only complete lines are scanned; a trailing partial line is
+    carried over to the next chunk.
+
+    Args:
+        log_file: A file object opened in binary mode.
+
+    Returns:
+        set: A set of unique PIDs that failed to be fetched.
+    """
+    failed_pids = set()
+    carry = b''
+    while chunk := log_file.read(LOG_READ_CHUNK_BYTES):
+        buffer = carry + chunk
+        last_newline = buffer.rfind(b'\n')
+        carry = buffer[last_newline + 1:]
+        failed_pids.update(match.group(1).decode('ascii') for match in PID_PATTERN.finditer(buffer, 0, last_newline + 1))
+    failed_pids.update(match.group(1).decode('ascii') for match in PID_PATTERN.finditer(carry)) # Last line without a newline
+    return failed_pids
+
 def extract_failed_pids(log_file_path):
     """
-    Reads a log file and extracts unique product IDs (PIDs) from lines
-    that specifically contain a '403 Client Error: Forbidden' for a PDP URL.
+    Reads a log file and extracts unique product IDs (PIDs) from PDP fetch error
+    lines that report a 403: 'HTTP Status Code: 403' as the current scraper logs it,
+    or '403 Client Error: Forbidden' in logs from the older requests-based version.
 
     Args:
         log_file_path (str): The path to the log file (e.g., 'scraper_log.log').
@@ -24,11 +58,6 @@ def extract_failed_pids(log_file_path):
         set: A set of unique PIDs that failed to be fetched.
     """
     failed_pids = set()
-    
-    # Regex to specifically match the error lines and capture the PID from "(ID: XXXXXX)"
-    # It looks for "Error fetching PDP URL", then any characters, then "(ID: " followed by digits (captured group 1),
-    # then "):", then any characters, then "403 Client Error: Forbidden".
-    pid_pattern = re.compile(r"Error fetching PDP URL .* \(ID: (\d+)\): .*403 Client Error: Forbidden")
 
     if not os.path.exists(log_file_path):
         logging.error(f"Log file not found: {log_file_path}")
@@ -36,12 +65,14 @@ def extract_failed_pids(log_file_path):
 
     logging.info(f"Reading log file: {log_file_path}")
     try:
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                match = pid_pattern.search(line)
-                if match:
-                    pid = match.group(1) # Group 1 contains the digits (PID)
-                    failed_pids.add(pid)
+        # Scan the mapped bytes in one pass instead of decoding every line into a str first
+        with open(log_file_path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for match in PID_PATTERN.finditer(mm):
+                        failed_pids.add(match.group(1).decode('ascii')) # Group 1 contains the digits (PID)
+            except (ValueError, OSError): # Empty files and pipes cannot be mapped
+                failed_pids = scan_failed_pids_in_chunks(f)
     except Exception as e:
         logging.error(f"An error occurred while reading the log file: {e}")
         return set()
@@ -63,9 +94,8 @@ def save_pids_to_file(pids_set, output_file_path):
 
     try:
         with open(output_file_path, 'w', encoding='utf-8') as f:
-            # Convert set to a list and sort it for consistent output order
-            for pid in sorted(list(pids_set)):
-                f.write(f"{pid}\n")
+            # Sort for consistent output order and write every line in a single call
+            f.write('\n'.join(sorted(pids_set)) + '\n')
         logging.info(f"Successfully saved {len(pids_set)} PIDs to {output_file_path}")
     except Exception as e:
         logging.error(f"An error occurred while saving PIDs to file: {e}")
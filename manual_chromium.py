@@ -10,10 +10,12 @@ async def open_browser_for_manual_interaction(url="https://blinkit.com/"):
     Opens a Playwright Chromium browser in headful mode using a persistent context,
     allows manual interaction, and keeps the context open until you press Enter.
     """
-    user_data_dir = "./tmp_user_data"
+    # Persistent profile; run blinkit_scrap.py with the same BLINKIT_PROFILE_DIR so a challenge solved here carries over
+    user_data_dir = os.environ.get("BLINKIT_PROFILE_DIR") or "./tmp_user_data"
     os.makedirs(user_data_dir, exist_ok=True)
     
     logging.info(f"Opening browser for manual interaction. User data will be saved to: {user_data_dir}")
+    logging.info(f"To reuse this profile in the scraper, run it with BLINKIT_PROFILE_DIR={user_data_dir}")
     logging.info("Navigate to the desired page, resolve any challenges (like Cloudflare), or set location.")
     logging.info("Once done, close the browser window OR press Enter in this console to proceed.")
 
@@ -23,7 +25,15 @@ async def open_browser_for_manual_interaction(url="https://blinkit.com/"):
             context = await p.chromium.launch_persistent_context(
                 user_data_dir=user_data_dir,
                 headless=False,  # Essential: opens a visible browser window
-                args=['--no-sandbox', '--disable-setuid-sandbox'] # Good practice args
+                args=[
+                    '--no-sandbox', '--disable-setuid-sandbox', # Good practice args
+                    '--disable-dev-shm-usage', # Same as blinkit_scrap.py
+                    # Skip startup work a one-off manual session does not need
+                    '--disable-gpu',
+                    '--no-first-run', '--no-default-browser-check',
+                    '--disable-extensions', '--disable-background-networking',
+                    '--disable-blink-features=AutomationControlled', # Drops navigator.webdriver while solving challenges
+                ]
             )
             page = await context.new_page()
             await page.goto(url)
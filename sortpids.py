@@ -1,15 +1,12 @@
 # sort_numbers.py
 
-# Read numbers from the file
+# Read numbers from the file; split() skips blank lines and surrounding whitespace in one C-level pass.
+# PIDs logged more than once (e.g. retried fetches) are kept once.
 with open('pids_from_log.txt', 'r') as f:
-    numbers = [int(line.strip()) for line in f if line.strip()]
+    numbers = sorted(set(map(int, f.read().split())))
 
-# Sort the numbers
-numbers.sort()
-
-# Write the sorted numbers to a new file
+# Write the sorted unique numbers to a new file in a single write
 with open('sorted_output.txt', 'w') as f:
-    for number in numbers:
-        f.write(f"{number}\n")
+    f.write(''.join(f"{number}\n" for number in numbers))
 
 print("Numbers sorted and written to sorted_output.txt")